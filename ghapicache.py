@@ -5,17 +5,140 @@ Cache API calls from GitHub.
 """
 
 import json
+from json.encoder import encode_basestring_ascii
 import atexit
 import hashlib
+import os
+import sqlite3
+import threading
+import time
 import requests
 
 from os import environ
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Tuple, Callable, Optional
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict, List, Tuple, Callable, Iterable, Optional, Set
 
 from ghapi.all import GhApi
-
-from fastcore.xtras import obj2dict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from fastcore.foundation import L
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content hashes match the length of a SHA-1 digest regardless of algorithm
+CONTENT_HASH_BYTES = 20
+
+
+# Reused encoder for cache subkeys: json.dumps constructs a new encoder on
+# every call with non-default options.
+# NOTE: keys are persisted, so keep the stdlib format: orjson's compact
+# separators would invalidate every existing entry
+_SUBKEY_ENCODER = json.JSONEncoder(sort_keys=True, default=str)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize to JSON bytes, using orjson if available."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _json_loads(data: bytes) -> Any:
+    """Deserialize JSON bytes, using orjson if available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _content_hasher():
+    """Create a hasher for content-addressed file names, using BLAKE3 if
+    available."""
+    if blake3 is not None:
+        return blake3(max_threads=blake3.AUTO)
+    return hashlib.sha1()
+
+
+def _content_digest(hasher) -> str:
+    """Get the hex digest used as a content-addressed file name."""
+    if blake3 is not None:
+        return hasher.hexdigest(length=CONTENT_HASH_BYTES)
+    return hasher.hexdigest()
+
+
+def _to_plain(obj: Any) -> Any:
+    """Convert a ghapi result (nested ``AttrDict`` and ``L``) to plain types.
+
+    This is equivalent to ``obj2dict`` but builds each container once and
+    doesn't recurse into scalars.
+    """
+    if isinstance(obj, dict):
+        return {
+            k: _to_plain(v) if isinstance(v, (dict, list, L)) else v
+            for (k, v) in obj.items()
+        }
+    if isinstance(obj, (list, L)):
+        return [_to_plain(v) if isinstance(v, (dict, list, L)) else v for v in obj]
+    return obj
+
+
+def _graphql_user(author: Optional[dict]) -> dict:
+    """Convert a GraphQL actor to a REST user (deleted users are null)."""
+    if not author:
+        return {"login": "ghost"}
+    login = author["login"]
+    if author["__typename"] == "Bot":
+        # REST logins for apps have a suffix that GraphQL omits
+        login += "[bot]"
+    return {"login": login}
+
+
+def _graphql_pull_to_rest(pr: dict) -> Tuple[dict, list]:
+    """Convert a GraphQL pull request to REST-shaped pull and reviews.
+
+    Only the subset of REST fields used by the release scripts is filled, so
+    these are cached as summaries rather than full REST responses.
+    """
+    labels = [{"name": lab["name"]} for lab in pr["labels"]["nodes"]]
+    merge_commit = pr["mergeCommit"]
+    pull = {
+        "number": pr["number"],
+        "title": pr["title"],
+        "body": pr["body"],
+        "html_url": pr["url"],
+        "state": "open" if pr["state"] == "OPEN" else "closed",
+        "merged": pr["state"] == "MERGED",
+        "created_at": pr["createdAt"],
+        "merged_at": pr["mergedAt"],
+        "merge_commit_sha": merge_commit["oid"] if merge_commit else None,
+        "user": _graphql_user(pr["author"]),
+        "labels": labels,
+    }
+    reviews = [
+        {
+            "user": _graphql_user(r["author"]),
+            "state": r["state"],
+            "submitted_at": r["submittedAt"],
+        }
+        for r in pr["reviews"]["nodes"]
+    ]
+    return (pull, reviews)
 
 
 def _load_ghapi_token():
@@ -32,6 +155,35 @@ def _load_ghapi_token():
     return None
 
 
+# Size of chunks streamed from a download to disk
+DOWNLOAD_CHUNK_BYTES = 1 << 16
+
+# Permissions of downloaded files
+DOWNLOAD_FILE_MODE = 0o644
+
+# Number of concurrent downloads in download_files
+DOWNLOAD_WORKERS = 8
+
+# Default limit on the total size of downloaded files
+DEFAULT_MAX_DOWNLOAD_BYTES = 2 << 30
+
+# Compress cached values at least this large if zstandard is available
+ZSTD_MIN_BYTES = 256
+ZSTD_LEVEL = 3
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Number of pull requests to load with a single GraphQL query
+GRAPHQL_BATCH_SIZE = 50
+
+# Pull request fields loaded from GraphQL to populate pull summaries
+GRAPHQL_PULL_FIELDS = """
+number title body url state createdAt mergedAt
+author { __typename login }
+mergeCommit { oid }
+labels(first: 100) { nodes { name } }
+reviews(first: 100) { nodes { author { __typename login } state submittedAt } }
+"""
+
 DEFAULTS = dict(
     owner="celeritas-project",
     repo="celeritas",
@@ -39,6 +191,130 @@ DEFAULTS = dict(
 )
 
 
+class CategoryCache(dict):
+    """Cache categories, each lazily loaded from a database on first access.
+
+    Entries are stored in an SQLite database as they're recorded, so only
+    categories modified in memory (``dirty``) need to be rewritten by
+    ``flush``. The database uses write-ahead logging so that it can be
+    shared by multiple processes, and access is locked so that it can be
+    shared by multiple threads. Large values are compressed with zstd if
+    the zstandard package is available.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+        # Categories modified other than through ``record``
+        self.dirty: Set[str] = set()
+        self._lock = threading.RLock()
+        # NOTE: (de)compressors are only used while holding the lock
+        if zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self._decompressor = zstandard.ZstdDecompressor()
+        else:
+            self._compressor = self._decompressor = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries("
+            "category TEXT, subkey TEXT, value BLOB, atime INTEGER, "
+            "PRIMARY KEY(category, subkey))"
+        )
+
+    def __missing__(self, category: str) -> Dict[str, Any]:
+        with self._lock:
+            if category in self:
+                # Loaded by another thread
+                return self[category]
+            rows = self._db.execute(
+                "SELECT subkey, value FROM entries WHERE category = ?", (category,)
+            )
+            entries = self[category] = {}
+            for (subkey, data) in rows:
+                try:
+                    entries[subkey] = self._decode(data)
+                except ValueError as e:
+                    print(f"Failed to load {category} entry {subkey}:", e)
+        return entries
+
+    def _encode(self, value: Any) -> bytes:
+        data = _json_dumps(value)
+        if self._compressor is not None and len(data) >= ZSTD_MIN_BYTES:
+            data = self._compressor.compress(data)
+        return data
+
+    def _decode(self, data: bytes) -> Any:
+        if data[:4] == ZSTD_MAGIC:
+            if self._decompressor is None:
+                raise ValueError("zstandard is required to load compressed entries")
+            data = self._decompressor.decompress(data)
+        return _json_loads(data)
+
+    @contextmanager
+    def _transaction(self):
+        # NOTE: caller must hold the lock
+        self._db.execute("BEGIN")
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        else:
+            self._db.execute("COMMIT")
+
+    def record(self, category: str, subkey: str, value: Any) -> None:
+        """Add an entry to a category and save it to the database."""
+        with self._lock:
+            self[category][subkey] = value
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (category, subkey, self._encode(value), int(time.time())),
+            )
+
+    def discard(self, category: str, subkey: str) -> None:
+        """Remove an entry from a category and the database if present."""
+        with self._lock:
+            self[category].pop(subkey, None)
+            self._db.execute(
+                "DELETE FROM entries WHERE category = ? AND subkey = ?",
+                (category, subkey),
+            )
+
+    def flush(self) -> list:
+        """Rewrite categories that were modified in memory.
+
+        Returns:
+            Names of the saved categories
+        """
+        with self._lock:
+            saved = [c for c in self.dirty if c in self]
+            atime = int(time.time())
+            for category in saved:
+                with self._transaction() as db:
+                    db.execute("DELETE FROM entries WHERE category = ?", (category,))
+                    db.executemany(
+                        "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                        (
+                            (category, k, self._encode(v), atime)
+                            for (k, v) in self[category].items()
+                        ),
+                    )
+            self.dirty.clear()
+        return saved
+
+    def purge(self) -> None:
+        """Clear all categories and delete their entries."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self.clear()
+            self.dirty.clear()
+
+
 class GhApiCache:
     def __init__(
         self,
@@ -47,36 +323,64 @@ class GhApiCache:
         repo: Optional[str] = None,
         token: Optional[str] = None,
         cache_file: Optional[Path] = None,
+        max_download_bytes: int = DEFAULT_MAX_DOWNLOAD_BYTES,
         **kwargs: Any,
     ) -> None:
         """
         Initializes the cache wrapper around a ghapi instance with
         class methods for specific API endpoints.
         Lazily accesses DEFAULTS at instantiation time.
+
+        Downloaded files are evicted, least recently used first, when their
+        total size exceeds ``max_download_bytes``.
         """
         owner = owner if owner is not None else DEFAULTS["owner"]
         repo = repo if repo is not None else DEFAULTS["repo"]
         token = token if token is not None else DEFAULTS["token"]
         if cache_file is None:
             cache_file = Path(f"data/ghapicache-{owner}-{repo}.json")
+        # Single-file JSON cache from older versions
         self.cache_file = cache_file
+        self.cache_db = cache_file.with_suffix(".db")
 
         self.api = GhApi(owner=owner, repo=repo, token=token, **kwargs)
         self.owner: str = owner or ""
         self.repo: str = repo
 
+        # Reuse connections for file downloads
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            # Return the last response when retries run out so that
+            # raise_for_status reports an HTTPError
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("https://", adapter)
+
         # Create downloads directory
         self.downloads_dir: Path = self.cache_file.parent / "ghapicache-downloads"
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
-
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.dirty = False
-        self._load_cache()
-
-        # Ensure files cache exists
-        if "files" not in self.cache:
-            self.cache["files"] = {}
-            self.dirty = True
+        self.max_download_bytes = max_download_bytes
+        # Guard bookkeeping of downloaded files across threads
+        self._files_lock = threading.Lock()
+        # Content-addressed files already on disk (skipping partial downloads)
+        self._stored_files = {
+            f for f in os.listdir(self.downloads_dir) if not f.startswith(".")
+        }
+
+        # Downloads are cached in "files" (URL -> filename) and "files_meta"
+        # (filename -> [size, atime])
+        import_cache_file = self.cache_file.exists() and not self.cache_db.exists()
+        self.cache = CategoryCache(self.cache_db)
+        if import_cache_file:
+            self._import_cache_file()
+        self._scan_downloads()
 
         atexit.register(self.flush)
 
@@ -89,6 +393,33 @@ class GhApiCache:
     def reviews(self, pr_id: int) -> Any:
         return self._cached_request("reviews", self.api.pulls.list_reviews, pr_id)
 
+    def pull_summary(self, pr_id: int) -> Any:
+        """Get the pull request fields used by the release scripts.
+
+        This is the GraphQL summary from ``prefetch_prs`` if one was loaded,
+        otherwise the full REST response.
+        """
+        try:
+            return self.cache["pull_summary"][self.subkey(pr_id)]
+        except KeyError:
+            return self.pull(pr_id)
+
+    def reviews_summary(self, pr_id: int) -> Any:
+        """Get pull request reviews with the fields used by the release scripts.
+
+        See ``pull_summary``.
+        """
+        try:
+            return self.cache["reviews_summary"][self.subkey(pr_id)]
+        except KeyError:
+            return self.reviews(pr_id)
+
+    def discard_pull(self, pr_id: int) -> None:
+        """Remove a cached pull request and its reviews so they're reloaded."""
+        subkey = self.subkey(pr_id)
+        for category in ("pull", "reviews", "pull_summary", "reviews_summary"):
+            self.cache.discard(category, subkey)
+
     def user(self, username: str) -> Any:
         return self._cached_request("user", self.api.users.get_by_username, username)
 
@@ -120,11 +451,54 @@ class GhApiCache:
             org = self.owner
         return self._cached_request("team", self.api.teams.list, org)
 
-    def download_file(self, url: str, content_type: Optional[str] = None, ext: Optional[str] = None) -> Path:
+    def prefetch_prs(self, pr_ids: Iterable[int]) -> None:
+        """Load uncached pull requests with batched GraphQL queries.
+
+        Each query loads up to ``GRAPHQL_BATCH_SIZE`` pull requests along with
+        their reviews and labels. Since only some REST fields are available,
+        they're cached separately for ``pull_summary`` and ``reviews_summary``
+        rather than as ``pull`` and ``reviews`` responses.
+        """
+        pulls = self.cache["pull"]
+        summaries = self.cache["pull_summary"]
+        missing = [
+            i
+            for i in dict.fromkeys(pr_ids)
+            if (k := self.subkey(i)) not in pulls and k not in summaries
+        ]
+        for start in range(0, len(missing), GRAPHQL_BATCH_SIZE):
+            batch = missing[start : start + GRAPHQL_BATCH_SIZE]
+            print(f"Loading {len(batch)} pull requests with GraphQL")
+            aliases = "\n".join(
+                f"pr{i}: pullRequest(number: {i}) {{{GRAPHQL_PULL_FIELDS}}}"
+                for i in batch
+            )
+            query = (
+                f'query {{ repository(owner: "{self.owner}", name: "{self.repo}")'
+                f" {{ {aliases} }} }}"
+            )
+            result = _to_plain(self.api("/graphql", "POST", data={"query": query}))
+            for error in result.get("errors") or []:
+                print("GraphQL error:", error.get("message"))
+
+            prs = (result.get("data") or {}).get("repository") or {}
+            for pr_id in batch:
+                if not (pr := prs.get(f"pr{pr_id}")):
+                    continue
+                (pull, reviews) = _graphql_pull_to_rest(pr)
+                self._record("pull_summary", self.subkey(pr_id), pull)
+                self._record("reviews_summary", self.subkey(pr_id), reviews)
+
+    def download_path(
+        self, url: str, content_type: Optional[str] = None, ext: Optional[str] = None
+    ) -> Path:
         """
         Downloads a file from the given URL and caches it by content hash in the
         ghapicache-downloads directory. Maps URL to content hash in the cache.
 
+        The response is streamed to disk and hashed in a single pass, so the
+        file is never held in memory.
+
         Args:
             url: The URL to download from
             ext: Optional file extension (if not provided, will try to extract from URL)
@@ -136,105 +510,260 @@ class GhApiCache:
         # Check if URL is already in our files cache
         if filename := self.cache["files"].get(url):
             file_path = self.downloads_dir / filename
-            if file_path.exists():
+            if filename in self._stored_files:
                 # File exists in cache, return it
                 print(f"Loading {url} from cached file {file_path}")
-                with open(file_path, "rb") as f:
-                    return f.read()
+                with self._files_lock:
+                    self._touch_file(filename)
+                return file_path
 
         # File not in cache or cache entry invalid, download it
         print(f"Downloading {url}")
         headers = {}
         if content_type is not None:
             headers["Accept"] = content_type
-        r = requests.get(url, headers=headers)
-        r.raise_for_status()
-        self.cache_file_to_url(r.content, url, ext)
-        return r.content
-
-    def cache_file_to_url(self, content: bytes, url: str, ext: Optional[str] = None) -> bytes:
-        if url in self.cache["files"]:
-            content_hash = self.cache["files"][url]
+        h = _content_hasher()
+        tmp = NamedTemporaryFile(dir=self.downloads_dir, prefix=".", delete=False)
+        try:
+            with tmp, self._session.get(url, headers=headers, stream=True) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                    h.update(chunk)
+                    tmp.write(chunk)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+        filename = _content_digest(h) + self._file_ext(url, ext)
+        file_path = self.downloads_dir / filename
+        if filename in self._stored_files:
+            # Identical content was already downloaded from another URL
+            os.unlink(tmp.name)
         else:
-            content_hash = hashlib.sha1(content).hexdigest()
+            # Temporary files are only readable by their owner
+            os.chmod(tmp.name, DOWNLOAD_FILE_MODE)
+            os.replace(tmp.name, file_path)
+        self._add_file(url, filename)
+        return file_path
+
+    def download_files(
+        self,
+        urls: Iterable[str],
+        content_type: Optional[str] = None,
+        max_workers: int = DOWNLOAD_WORKERS,
+    ) -> List[Path]:
+        """Download and cache multiple files concurrently.
 
-        # Determine file extension
+        Returns:
+            Paths to the cached files, in the same order as the URLs
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                executor.map(lambda url: self.download_path(url, content_type), urls)
+            )
+
+    def download_file(
+        self, url: str, content_type: Optional[str] = None, ext: Optional[str] = None
+    ) -> bytes:
+        """
+        Downloads and caches a file (see ``download_path``).
+
+        Returns:
+            Content of the cached file
+        """
+        return self.download_path(url, content_type, ext).read_bytes()
+
+    @staticmethod
+    def _file_ext(url: str, ext: Optional[str] = None) -> str:
+        """Get the extension for a cached file."""
         if ext is None:
             # Try to extract extension from URL
             path = Path(url.partition("?")[0])  # Remove query params
-            ext = path.suffix or ""
+            return path.suffix or ""
         elif ext:
             # Get just the final extension
-            ext = "." + ext.split(".")[-1]
+            return "." + ext.split(".")[-1]
+        return ext
 
-        # Create filename from content hash
-        filename = f"{content_hash}{ext}"
-        file_path = self.downloads_dir / filename
+    def cache_file_to_url(self, content: bytes, url: str, ext: Optional[str] = None) -> Path:
+        """Save content as the cached download for a URL.
+
+        The URL may already be cached with different (e.g. re-uploaded)
+        content, so the filename always comes from the new content's hash.
 
-        # Save the file
-        if not file_path.exists():
-            with open(file_path, "wb") as f:
-                f.write(content)
+        Returns:
+            Path to the cached file
+        """
+        # Create filename from content hash
+        h = _content_hasher()
+        h.update(content)
+        filename = _content_digest(h) + self._file_ext(url, ext)
+
+        # Save the file unless it already exists: content-addressed files are
+        # immutable, so an exclusive create skips existing files atomically
+        if filename not in self._stored_files:
+            try:
+                fd = os.open(
+                    self.downloads_dir / filename,
+                    os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                    DOWNLOAD_FILE_MODE,
+                )
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
 
         # Update the cache
-        self.cache["files"][url] = filename
-        self.dirty = True
+        self._add_file(url, filename)
 
-        return content
+        return self.downloads_dir / filename
+
+    def _add_file(self, url: str, filename: str) -> None:
+        """Record a file saved to the downloads directory."""
+        with self._files_lock:
+            self._stored_files.add(filename)
+            self._record("files", url, filename)
+            self._touch_file(filename)
+            self._evict_if_needed(keep=filename)
+
+    def _scan_downloads(self) -> None:
+        """Track files on disk that aren't in ``files_meta`` and apply the
+        size limit to them.
+
+        Untracked files (such as those downloaded by older versions) are
+        counted using their modification time as the access time.
+        """
+        with self._files_lock:
+            meta = self.cache["files_meta"]
+            for filename in [f for f in meta if f not in self._stored_files]:
+                self.cache.discard("files_meta", filename)
+            for filename in self._stored_files - meta.keys():
+                st = (self.downloads_dir / filename).stat()
+                self._record("files_meta", filename, [st.st_size, st.st_mtime])
+            self._evict_if_needed()
+
+    def _touch_file(self, filename: str) -> None:
+        """Update the size and access time of a downloaded file.
+
+        The caller must hold the files lock.
+        """
+        try:
+            (size, _) = self.cache["files_meta"][filename]
+        except KeyError:
+            size = (self.downloads_dir / filename).stat().st_size
+        self._record("files_meta", filename, [size, time.time()])
+
+    def _evict_if_needed(self, keep: Optional[str] = None) -> None:
+        """Delete least recently used files until under the size limit.
+
+        The just-added file ``keep`` is never evicted. The caller must hold
+        the files lock.
+        """
+        meta = self.cache["files_meta"]
+        total = sum(size for (size, _) in meta.values())
+        if total <= self.max_download_bytes:
+            return
+
+        evicted = set()
+        for filename in sorted(meta, key=lambda f: meta[f][1]):
+            if total <= self.max_download_bytes:
+                break
+            if filename == keep:
+                continue
+            (size, _) = meta[filename]
+            self.cache.discard("files_meta", filename)
+            total -= size
+            evicted.add(filename)
+            self._stored_files.discard(filename)
+            try:
+                (self.downloads_dir / filename).unlink()
+            except FileNotFoundError:
+                pass
+            print(f"Evicted cached file {filename}")
+
+        files = self.cache["files"]
+        for url in [u for (u, f) in files.items() if f in evicted]:
+            self.cache.discard("files", url)
+
+    def purge_downloads(self):
+        """Delete all downloaded files and clear their cache entries."""
+        with self._files_lock:
+            for file_path in self.downloads_dir.iterdir():
+                file_path.unlink()
+            self._stored_files.clear()
+            for category in ("files", "files_meta"):
+                for subkey in list(self.cache[category]):
+                    self.cache.discard(category, subkey)
+        print("Deleted downloaded files in:", self.downloads_dir)
 
     def purge(self):
-        """Clear the cache and delete the cache file."""
-        self.cache = {}
-        self.dirty = False
+        """Clear the cache and delete all its entries."""
         try:
-            self.cache_file.unlink()
+            self.cache.purge()
+            self.cache_file.unlink(missing_ok=True)
         except Exception as e:
-            print("Failed to delete cache file:", e)
+            print("Failed to delete cache:", e)
         else:
-            print("Deleted cache file:", self.cache_file)
+            print("Deleted cache entries:", self.cache_db)
 
     def flush(self):
-        if not self.dirty:
-            return
+        """Save categories that were modified in memory (``cache.dirty``).
+
+        New entries are saved to the database as soon as they're added.
+        """
         try:
-            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.cache_file, "w") as f:
-                json.dump(self.cache, f)
+            saved = self.cache.flush()
         except Exception as e:
             print("Failed to save cache:", e)
         else:
-            print("Saved cache to:", self.cache_file)
-            self.dirty = False
+            if saved:
+                print(f"Saved cache to {self.cache_db}:", ", ".join(saved))
 
-    def _load_cache(self):
+    def _import_cache_file(self):
+        """Import a single-file cache from an older version."""
         try:
-            with open(self.cache_file, "r") as f:
-                self.cache = json.load(f)
+            with open(self.cache_file, "rb") as f:
+                cache = _json_loads(f.read())
         except Exception as e:
-            self.cache = {}
             print("Failed to load cache:", e)
+            return
+        self.cache.update(cache)
+        self.cache.dirty.update(cache)
+        self.flush()
 
     def subkey(self, *args, **kwargs) -> str:
+        if len(args) == 1 and not kwargs:
+            # Fast path for single-argument endpoints, with identical keys
+            (arg,) = args
+            if type(arg) is int:
+                return f"[[{arg}], []]"
+            if type(arg) is str:
+                return f"[[{encode_basestring_ascii(arg)}], []]"
         try:
             key_data = (args, sorted(kwargs.items()))
-            return json.dumps(key_data, sort_keys=True, default=str)
+            return _SUBKEY_ENCODER.encode(key_data)
         except Exception:
             return str((args, kwargs))
 
     def _cached_request(self, category: str, func: Callable, *args, **kwargs) -> Any:
-        # Ensure the category exists in the cache, then use a local variable for performance.
-        cat_cache = self.cache.setdefault(category, {})
+        # Load the category if needed, then use a local variable for performance.
+        cat_cache = self.cache[category]
         subkey = self.subkey(*args, **kwargs)
         try:
             response = cat_cache[subkey]
         except KeyError:
-            cat_cache[subkey] = response = obj2dict(func(*args, **kwargs))
-            self.dirty = True
+            response = _to_plain(func(*args, **kwargs))
+            self._record(category, subkey, response)
         return response
 
+    def _record(self, category: str, subkey: str, value: Any) -> None:
+        self.cache.record(category, subkey, value)
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.flush()
+        self._session.close()
 
@@ -6,7 +6,9 @@
 Helper functions for release note generation and other GitHub processing.
 """
 
+import functools
 import re
+import shutil
 import subprocess
 
 from pathlib import Path
@@ -15,14 +17,40 @@ from gzip import GzipFile
 from io import BytesIO
 from typing import IO
 
+try:
+    # SIMD-accelerated deflate, whose highest level is 3
+    from isal.igzip import IGzipFile
+    from isal.isal_zlib import ISAL_BEST_COMPRESSION as ISAL_MAX_COMPRESSLEVEL
+except ImportError:
+    IGzipFile = None
+    ISAL_MAX_COMPRESSLEVEL = -1
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+try:
+    # Linear-time regex engine with the same API
+    import re2
+except ImportError:
+    re2 = re
+
 
 MISSING_PR_ID = {
     "Fix linking to CUDA toolkit when using VecGeom": 989,
 }
 GIT = "git"
 REPO = Path.home() / "Code/celeritas-temp"
-RE_SUBJECT_PR_SQUASH = re.compile(r"\(#([\d]+)\)$")
-RE_SUBJECT_PR_MERGE = re.compile(r"^Merge pull request #([\d]+)")
+# Squash-merge or merge-commit subject: both alternatives are anchored at the
+# start so that the squash-merge suffix takes precedence
+RE_SUBJECT_PR = re2.compile(
+    r"^(?:.*\(#(?P<squash>\d+)\)|Merge pull request #(?P<merge>\d+).*)$"
+)
+
+
+def gitenv():
+    return {"GIT_DIR": str(REPO / ".git")}
 
 
 def gitrun(*args):
@@ -30,47 +58,146 @@ def gitrun(*args):
         (GIT,) + args,
         capture_output=True,
         check=True,
-        env={"GIT_DIR": str(REPO / ".git")},
+        env=gitenv(),
     )
 
 
 def git(*args, split=b"\n") -> list[str]:
     result = gitrun(*args)
-    return [s.decode() for s in result.stdout.split(split)]
+    # Decode the whole output at once rather than each line
+    return result.stdout.decode().split(split.decode())
 
 
 def gitz(subcommand, *args) -> list:
     return git(subcommand, "-z", *args, split=b"\0")
 
 
+_PYGIT2_REPOS = {}
+
+
+def _pygit2_repo():
+    """Get an in-process libgit2 repository for REPO if pygit2 is available.
+
+    This avoids spawning a git process for the common queries.
+    """
+    if pygit2 is None:
+        return None
+    path = str(REPO / ".git")
+    try:
+        return _PYGIT2_REPOS[path]
+    except KeyError:
+        pass
+    repo = _PYGIT2_REPOS[path] = pygit2.Repository(path)
+    return repo
+
+
+def _pygit2_commit(repo, commitish: str):
+    return repo.revparse_single(commitish).peel(pygit2.Commit)
+
+
+def _pygit2_subject(message: str) -> str:
+    """Get the subject (first paragraph joined into one line) like ``%s``."""
+    paragraph = message.lstrip("\n").split("\n\n", 1)[0]
+    return " ".join(line.strip() for line in paragraph.splitlines())
+
+
+def _pygit2_paths(tree, prefix=""):
+    for obj in tree:
+        path = prefix + obj.name
+        if obj.type_str == "tree":
+            yield from _pygit2_paths(obj, path + "/")
+        else:
+            yield path
+
+
 def git_log_subjects(start, stop, first_parent=True):
+    """Generate (hash, subject) pairs for commits in ``start..stop``."""
+    if (repo := _pygit2_repo()) is not None:
+        walker = repo.walk(_pygit2_commit(repo, stop).id)
+        if start:
+            walker.hide(_pygit2_commit(repo, start).id)
+        if first_parent:
+            walker.simplify_first_parent()
+        for c in walker:
+            yield (str(c.id), _pygit2_subject(c.message))
+        return
+
     span = stop
     if start:
         span = start + ".." + stop
     args = []
     if first_parent:
         args.append("--first-parent")
-    # TODO: return (hash, subject) pairs
-    # args += [r"--format=%H\\t%s", span]
-    args += [r"--format=%s", span]
-    return git("log", *args)
+    args += ["-z", "--format=%H %s", span]
+    for entry in gitrun("log", *args).stdout.split(b"\0"):
+        if entry:
+            yield (entry[:40].decode(), entry[41:].decode())
+
+
+def git_log_multi(include, exclude=(), first_parent=True):
+    """Generate (hash, subject) pairs for commits reachable from any of
+    ``include`` but none of ``exclude`` in a single history walk.
+    """
+    if (repo := _pygit2_repo()) is not None:
+        walker = None
+        for ref in include:
+            oid = _pygit2_commit(repo, ref).id
+            if walker is None:
+                walker = repo.walk(oid)
+            else:
+                walker.push(oid)
+        if walker is None:
+            return
+        for ref in exclude:
+            walker.hide(_pygit2_commit(repo, ref).id)
+        if first_parent:
+            walker.simplify_first_parent()
+        for c in walker:
+            yield (str(c.id), _pygit2_subject(c.message))
+        return
+
+    include = list(include)
+    if not include:
+        return
+    args = []
+    if first_parent:
+        args.append("--first-parent")
+    args += ["-z", "--format=%H %s", *include]
+    args += ["^" + ref for ref in exclude]
+    for entry in gitrun("log", *args, "--").stdout.split(b"\0"):
+        if entry:
+            yield (entry[:40].decode(), entry[41:].decode())
 
 
 def git_merge_base(a, b) -> str:
+    if (repo := _pygit2_repo()) is not None:
+        oid = repo.merge_base(_pygit2_commit(repo, a).id, _pygit2_commit(repo, b).id)
+        if oid is None:
+            # Unrelated histories: fail the same way as the git command
+            raise subprocess.CalledProcessError(1, (GIT, "merge-base", a, b))
+        return str(oid)
     return git("merge-base", a, b)[0]
 
 
 def git_rev_parse(commitish: str) -> str:
-    repr(commitish)
-    result = git("rev-parse", commitish)[0]
+    if (repo := _pygit2_repo()) is not None:
+        result = str(repo.revparse_single(commitish).id)
+    else:
+        result = git("rev-parse", commitish)[0]
     assert len(result) == 40
     return result
 
 
+@functools.lru_cache(maxsize=4096)
+def _match_subject_pr(subj):
+    if match := RE_SUBJECT_PR.search(subj):
+        return int(match.group("squash") or match.group("merge"))
+    return None
+
+
 def subject_to_pr(subj):
-    for expr in [RE_SUBJECT_PR_SQUASH, RE_SUBJECT_PR_MERGE]:
-        if match := expr.search(subj):
-            return int(match.group(1))
+    if (pr := _match_subject_pr(subj)) is not None:
+        return pr
     if subj:
         try:
             return MISSING_PR_ID[subj]
@@ -93,16 +220,36 @@ def git_renames(old_ref: str, new_ref: str):
 
 
 def git_lstree(ref: str) -> list[str]:
-    return gitz("ls-tree", "-r", "--name-only", ref)
+    if (repo := _pygit2_repo()) is not None:
+        return list(_pygit2_paths(_pygit2_commit(repo, ref).tree))
+    # Drop the empty entry after the final NUL
+    return [path for path in gitz("ls-tree", "-r", "--name-only", ref) if path]
 
 
 def git_archive_tgz(ref: str, compresslevel=9) -> bytes:
     """Export a commit's contents to a tgz file.
+
+    The tar output is compressed as it streams from git, using ISA-L if it
+    is available and supports the requested compression level.
     """
-    tarbytes = gitrun("archive", "--format=tar", ref).stdout
     buf = BytesIO()
-    with GzipFile(fileobj=buf, mode="wb", compresslevel=compresslevel) as gzbuf:
-        gzbuf.write(tarbytes)
+    gzip_file = GzipFile
+    if IGzipFile is not None and compresslevel <= ISAL_MAX_COMPRESSLEVEL:
+        gzip_file = IGzipFile
+    with subprocess.Popen(
+        (GIT, "archive", "--format=tar", ref),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=gitenv(),
+    ) as process:
+        with gzip_file(fileobj=buf, mode="wb", compresslevel=compresslevel) as gzbuf:
+            shutil.copyfileobj(process.stdout, gzbuf)
+        # NOTE: git only writes a short error message, so this can't block
+        stderr = process.stderr.read()
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=stderr
+        )
     return buf.getvalue()
 
 
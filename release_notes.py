@@ -3,14 +3,17 @@
 Helper functions and classes for generating release notes and managing GitHub releases.
 """
 
+import functools
 import io
 import json
 from datetime import datetime
-from collections import defaultdict, namedtuple
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path, PurePath
 from typing import Dict, Optional, Union
 from markdown import markdown
 from ghapi.all import gh2date
+from fastcore.net import HTTP404NotFoundError
 from dataclasses import dataclass, field
 import githelpers as ghelp
 from ghapicache import GhApiCache
@@ -18,7 +21,9 @@ from uritemplate import URITemplate
 import re
 
 # Define namedtuples for data structures
-UserInfo = namedtuple("UserInfo", ["name", "institute", "email", "orcid", "github"])
+UserInfo = namedtuple(
+    "UserInfo", ["name", "institute", "email", "orcid", "github", "sort_key"]
+)
 Team = namedtuple("Team", ["description", "members"])
 Contributions = namedtuple("Contributions", ["author", "reviewer"])
 
@@ -32,6 +37,12 @@ CATEGORIES = {
     "removal": "Deprecation and removal",
 }
 
+# Number of concurrent GitHub requests when prefetching pull requests
+FETCH_WORKERS = 16
+
+# Number of concurrent GitHub requests when prefetching users
+USER_FETCH_WORKERS = 8
+
 # Team role mapping for Zenodo
 TEAM_ROLES = {
     "code-lead": "ProjectManager",
@@ -41,7 +52,11 @@ TEAM_ROLES = {
 
 
 class UserCache:
-    """Cache for user information from GitHub and local metadata."""
+    """Cache for user information from GitHub and local metadata.
+
+    GitHub user lookups are persisted across sessions by the ``GhApiCache``
+    "user" category, so only the merged ``UserInfo`` is kept in memory.
+    """
 
     def __init__(self, api_cache: GhApiCache, json_path: Path):
         """
@@ -53,9 +68,9 @@ class UserCache:
         self.json_path = json_path
         with open(json_path) as f:
             user_md = json.load(f)
-        self.name_fixup = user_md.get("github_names", {})
-        self.institutes = user_md.get("institute", {})
-        self.orcid = user_md.get("orcid", {})
+        self.name_fixup = user_md.pop("github_names", {})
+        self.institutes = user_md.pop("institute", {})
+        self.orcid = user_md.pop("orcid", {})
         self._api_cache = api_cache
         self._cache: Dict[str, UserInfo] = {}
 
@@ -63,12 +78,15 @@ class UserCache:
         """Load user info from GitHub and local metadata."""
 
         u = self._api_cache.user(username)
+        name = self.name_fixup.get(username, u["name"])
         return UserInfo(
-            name=self.name_fixup.get(username, u["name"]),
+            name=name,
             email=u["email"],
             institute=self.institutes.get(username),
             orcid=self.orcid.get(username),
             github=username,
+            # Sort by last name
+            sort_key=name.rsplit(" ", 1)[-1].lower() if name else "",
         )
 
     def __getitem__(self, username: str) -> UserInfo:
@@ -77,6 +95,17 @@ class UserCache:
             self._cache[username] = self._load_user_info(username)
         return self._cache[username]
 
+    def prefetch(self, usernames, max_workers=USER_FETCH_WORKERS):
+        """Load info for all the given users concurrently."""
+        missing = [u for u in set(usernames) if u not in self._cache]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (username, info) in zip(
+                missing, executor.map(self._load_user_info, missing)
+            ):
+                self._cache[username] = info
+
 
 def get_team(cached: GhApiCache, team_md: dict):
     members = frozenset(u["login"] for u in cached.team(team_md["slug"]))
@@ -85,9 +114,7 @@ def get_team(cached: GhApiCache, team_md: dict):
 
 def get_last_name(user_info):
     """Extract last name from user info for sorting."""
-    if name := user_info.name:
-        return name.split(" ")[-1]
-    return ""
+    return user_info.sort_key
 
 
 def format_user(user_info):
@@ -96,9 +123,9 @@ def format_user(user_info):
 
 
 def parse_log_pulls(logs):
-    """Extract PR numbers from git log output."""
-    for line in logs:
-        pr = ghelp.subject_to_pr(line)
+    """Extract PR numbers from git log (hash, subject) pairs."""
+    for (_, subject) in logs:
+        pr = ghelp.subject_to_pr(subject)
         if pr:
             yield pr
 
@@ -121,16 +148,9 @@ def list_contributors(prev_release, new_release, author_map=None):
         "log", "--pretty=format:%an", f"{prev_release}..{new_release}"
     )
 
-    author_count = defaultdict(int)
-    for auth in all_contributors:
-        try:
-            # Update from manual author list
-            auth = author_map[auth]
-        except KeyError:
-            pass
-        author_count[auth] += 1
-
-    return sorted(author_count.items(), key=lambda kv: kv[1], reverse=True)
+    # Update from manual author list
+    author_count = Counter(author_map.get(auth, auth) for auth in all_contributors)
+    return author_count.most_common()
 
 
 @dataclass
@@ -187,36 +207,64 @@ class PullRequestRange:
 
     def _compute_pull_ids(self):
         """Compute the list of pull request IDs for this release."""
-        # Compute merge bases and exclude IDs
-        exclude_ids = set()
-        for ref in self.metadata.merge_bases:
-            mb = ghelp.git_merge_base(self.metadata.target_branch, ref)
-            exclude_ids.update(parse_log_pulls(ghelp.git_log_subjects(mb, ref)))
+        target = self.metadata.target_branch
 
-        # Get pull IDs
-        first_merge_base = ghelp.git_merge_base(
-            self.metadata.target_branch, self.metadata.merge_bases[0]
-        )
-        pull_ids = list(
+        # Exclude pulls on the merge bases since they split from the target:
+        # commits reachable from a merge base but not the target are exactly
+        # those after its merge base with the target, so one walk covers all
+        exclude_ids = set(
             parse_log_pulls(
-                ghelp.git_log_subjects(first_merge_base, self.metadata.target_branch)
+                ghelp.git_log_multi(self.metadata.merge_bases, exclude=[target])
             )
         )
+
+        # Get pull IDs
+        first_merge_base = ghelp.git_merge_base(target, self.metadata.merge_bases[0])
+        pull_ids = list(
+            parse_log_pulls(ghelp.git_log_subjects(first_merge_base, target))
+        )
         return [p for p in pull_ids if p not in exclude_ids][::-1]
 
 
+def prefetch_pulls(cached_api: GhApiCache, pull_ids, max_workers=FETCH_WORKERS):
+    """Load pull requests and their reviews into the cache concurrently.
+
+    Fetching is network-bound, so this is much faster than loading each
+    pull request serially from ``ContributionCounter`` or ``SortedPulls``.
+    Most pull requests are loaded in batched GraphQL queries; any that those
+    miss are loaded individually through the REST API.
+    """
+    try:
+        cached_api.prefetch_prs(pull_ids)
+    except Exception as e:
+        print(f"Failed to prefetch with GraphQL: {e}")
+
+    def fetch(pr_id):
+        cached_api.pull_summary(pr_id)
+        cached_api.reviews_summary(pr_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {pr_id: executor.submit(fetch, pr_id) for pr_id in pull_ids}
+        for (pr_id, future) in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to prefetch PR #{pr_id}: {e}")
+
+
 class ContributionCounter:
     """Count contributions (authoring and reviewing) from pull requests."""
 
     def __init__(self, cached_api):
         """Initialize with a cached GitHub API instance."""
         self.cached_api = cached_api
-        self.author_count = defaultdict(int)
-        self.reviewer_count = defaultdict(int)
+        self.author_count = Counter()
+        self.reviewer_count = Counter()
 
     def __call__(self, pr_id):
         """Process a single pull request and update contribution counts."""
-        p, reviews = self.cached_api.pull(pr_id), self.cached_api.reviews(pr_id)
+        p = self.cached_api.pull_summary(pr_id)
+        reviews = self.cached_api.reviews_summary(pr_id)
 
         # Count author contribution
         author = p["user"]["login"]
@@ -228,20 +276,15 @@ class ContributionCounter:
         }
         pull_reviewers.discard(author)  # Remove author if they reviewed their own PR
 
-        for reviewer in pull_reviewers:
-            self.reviewer_count[reviewer] += 1
+        self.reviewer_count.update(pull_reviewers)
 
         return self
 
     def sorted(self):
         """Return sorted Contributions namedtuple."""
-
-        def sorted_count(d):
-            return dict(sorted(d.items(), key=lambda item: item[1], reverse=True))
-
         return Contributions(
-            author=sorted_count(self.author_count),
-            reviewer=sorted_count(self.reviewer_count),
+            author=dict(self.author_count.most_common()),
+            reviewer=dict(self.reviewer_count.most_common()),
         )
 
 
@@ -255,7 +298,7 @@ class SortedPulls:
         self.cached = cached_api
 
     def add(self, pr_id):
-        p = self.cached.pull(pr_id)
+        p = self.cached.pull_summary(pr_id)
         author = p["user"]["login"]
         labels = {lab["name"] for lab in p["labels"]}
 
@@ -264,14 +307,12 @@ class SortedPulls:
             "title": markdown_to_rst(p["title"]),
             "labels": labels,
             "author": author,
-            "merged_at": gh2date(p["merged_at"]),
-            "sha": p["merge_commit_sha"][:8],
         }
 
-        for lab in CATEGORIES:
-            if lab in labels:
-                self.pulls[lab].append(summary)
-                return
+        lab = next((c for c in CATEGORIES if c in labels), None)
+        if lab is not None:
+            self.pulls[lab].append(summary)
+            return
 
         raise ValueError(
             "Missing label: #{} ({}): {}".format(
@@ -343,7 +384,15 @@ class ReleaseNotes:
     def write(self, fp: io.TextIOWrapper):
         """Write notes to a file-like object."""
         ff = self.format_fill
-        fp.writelines(line.format(**ff) + "\n" for line in self.notes)
+
+        def format_line(line):
+            # Only template lines need to go through the format parser
+            if "{" in line or "}" in line:
+                return line.format(**ff)
+            return line
+
+        if self.notes:
+            fp.write("\n".join(map(format_line, self.notes)) + "\n")
 
     def __str__(self):
         with io.StringIO() as output:
@@ -431,6 +480,14 @@ def find_release(github_api, version: str):
     Returns:
         Release object if found, None otherwise
     """
+    try:
+        return github_api.repos.get_release_by_tag(tag="v" + version)
+    except HTTP404NotFoundError:
+        # Untagged drafts can only be found by name
+        pass
+    except Exception as e:
+        print(f"Error fetching release by tag: {str(e)}")
+
     try:
         releases = github_api.repos.list_releases()
         for release in releases:
@@ -473,7 +530,13 @@ def create_release(
     return release
 
 
-Tarball = namedtuple("Tarball", ["name", "url", "content"])
+class Tarball(namedtuple("Tarball", ["name", "url", "path"])):
+    """Release artifact stored in the download cache."""
+
+    @property
+    def content(self) -> bytes:
+        """Load the artifact into memory."""
+        return self.path.read_bytes()
 
 
 def get_tarball(ghapi_cache: GhApiCache, release: dict):
@@ -484,7 +547,7 @@ def get_tarball(ghapi_cache: GhApiCache, release: dict):
         return Tarball(
             assets[0]["name"],
             url,
-            ghapi_cache.download_file(url),
+            ghapi_cache.download_path(url),
         )
     elif len(assets) > 1:
         print("Multiple tarballs found in release assets")
@@ -530,8 +593,8 @@ def upload_asset(
     if not isinstance(browser_url, str):
         raise ValueError("failed to upload", uploaded)
     print(f"Uploaded artifact: {browser_url}")
-    ghapi_cache.cache_file_to_url(data, browser_url, ext=suffix)
-    return Tarball(name=name, url=browser_url, content=data)
+    path = ghapi_cache.cache_file_to_url(data, browser_url, ext=suffix)
+    return Tarball(name=name, url=browser_url, path=path)
 
 
 def ZenodoContribBuilder(ucache: UserCache):
@@ -549,6 +612,14 @@ def ZenodoContribBuilder(ucache: UserCache):
     return make_zenodo_contributor
 
 
+@functools.lru_cache(maxsize=32)
+def _render_body(body: str) -> str:
+    """Render a GitHub release body as HTML."""
+    if "\r" in body:
+        body = body.replace("\r\n", "\n")
+    return markdown(body)
+
+
 class ZenodoMetadataBuilder:
     def __init__(
         self,
@@ -576,6 +647,19 @@ class ZenodoMetadataBuilder:
         self.community = community
 
         self.make_zcontrib = ZenodoContribBuilder(user_cache)
+        self._team_contribs: dict = {}
+
+    def _team_contributors(self, team: str, role: str) -> list:
+        """Build Zenodo contributors for a team, reusing earlier results."""
+        key = (role, self.teams[team].members)
+        if (contribs := self._team_contribs.get(key)) is None:
+            contribs = [
+                self.make_zcontrib(username, role)
+                for username in self.teams[team].members
+            ]
+            self._team_contribs[key] = contribs
+        # Copy so callers can edit the metadata
+        return [dict(c) for c in contribs]
 
     def __call__(self, contrib, release_md, gh_release=None):
         """
@@ -589,6 +673,13 @@ class ZenodoMetadataBuilder:
         Returns:
             Dictionary containing Zenodo metadata.
         """
+        # Load all users up front rather than one request at a time
+        self.user_cache.prefetch(
+            set(contrib.author).union(
+                contrib.reviewer, *(self.teams[t].members for t in TEAM_ROLES)
+            )
+        )
+
         creators = [self.make_zcontrib(username) for username in contrib.author]
 
         # Generate contributors list (for non-authors): first, reviewers
@@ -599,8 +690,7 @@ class ZenodoMetadataBuilder:
 
         # Finally give credit to active team members
         for team, role in TEAM_ROLES.items():
-            for username in self.teams[team].members:
-                contributors.append(self.make_zcontrib(username, role))
+            contributors.extend(self._team_contributors(team, role))
 
         result = {
             "upload_type": "software",
@@ -623,7 +713,7 @@ class ZenodoMetadataBuilder:
             },
         }
         if gh_release is not None:
-            result["description"] = markdown(gh_release["body"].replace("\r\n", "\n"))
+            result["description"] = _render_body(gh_release["body"])
             result["publication_date"] = (
                 gh2date(gh_release["published_at"]).date().isoformat()
             )
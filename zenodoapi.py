@@ -5,7 +5,28 @@ Classes for interacting with Zenodo API and managing depositions.
 """
 
 import requests
-from typing import Dict, Any, List, Optional, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import (
+    BinaryIO,
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# Number of concurrent uploads to a deposition
+UPLOAD_WORKERS = 8
+
+# Number of results to request per page (the API defaults to 10)
+PAGE_SIZE = 100
 
 
 class Zenodo:
@@ -21,30 +42,61 @@ class Zenodo:
             access_token: The Zenodo API access token string
             token_path: Path to a file containing the token (used if access_token not provided)
         """
-        self.params = {"access_token": access_token}
+        # Keep connections alive across requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=32,
+            # Return the last response when retries run out so that
+            # raise_for_status reports an HTTPError
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.params = {"access_token": access_token}
 
     def request(
-        self, func: Callable, *args, params: Optional[dict] = None, **kwargs
+        self, verb: str, url: str, params: Optional[dict] = None, **kwargs
     ) -> Any:
         """Make a request to the Zenodo API.
 
         Args:
-            func: Function to call
-            *args: Positional arguments for the function
-            **kwargs: Keyword arguments for the function
+            verb: HTTP method
+            url: Request URL
+            params: Query parameters to add to the access token
+            **kwargs: Keyword arguments for ``requests.Session.request``
 
         Returns:
             Response data
         """
-        if params is not None:
-            params = params.copy()
-            params.update(self.params)
-        else:
-            params = self.params
-        r = func(*args, params=params, **kwargs)
+        r = self.session.request(verb, url, params=params, **kwargs)
         r.raise_for_status()
         return r.json()
 
+    def _paginate(self, url: str, params: Optional[dict] = None) -> Iterator[Any]:
+        """Iterate over the results of a paged request.
+
+        Pages are loaded only as they're consumed, following either the
+        ``Link`` header (deposit API) or the ``links`` in the response body
+        (search API).
+        """
+        while url:
+            r = self.session.get(url, params=params)
+            r.raise_for_status()
+            data = r.json()
+            if isinstance(data, dict):
+                yield from data["hits"]["hits"]
+                url = data.get("links", {}).get("next")
+            else:
+                yield from data
+                url = r.links.get("next", {}).get("url")
+            # Next-page links already include the query
+            params = None
+
     def create_deposition(
         self, metadata: Dict[str, Any], community=None
     ) -> "ZenodoDeposition":
@@ -57,7 +109,7 @@ class Zenodo:
             ZenodoDeposition object wrapping the new deposition
         """
         deposition_data = self.request(
-            requests.post,
+            "post",
             f"{self.api_url}/deposit/depositions",
             json={"metadata": metadata},
         )
@@ -70,7 +122,7 @@ class Zenodo:
 
     def get_deposition(self, id) -> "ZenodoDeposition":
         deposition_data = self.request(
-            requests.get,
+            "get",
             f"{self.api_url}/deposit/depositions/{id}",
         )
         return ZenodoDeposition(self, deposition_data)
@@ -87,21 +139,20 @@ class Zenodo:
         Raises:
             ValueError: If multiple matches found
         """
-        depositions = self.request(
-            requests.get,
+        depositions = []
+        for d in self._paginate(
             f"{self.api_url}/deposit/depositions",
-            params={"q": title, "page": 1, "size": 100},
-        )
+            params={"q": title, "page": 1, "size": PAGE_SIZE},
+        ):
+            # Check for exact match
+            if d["metadata"]["title"] == title:
+                # Bring me the sword of exact zero
+                return ZenodoDeposition(self, d)
+            depositions.append(d)
 
         if len(depositions) == 0:
             return
 
-        # Check for exact match
-        exact = [d for d in depositions if d["metadata"]["title"] == title]
-        if exact:
-            # Bring me the sword of exact zero
-            return ZenodoDeposition(self, exact[0])
-
         print(f"No exact match for {title}: found titles:")
         for d in depositions:
             print(f"- {d['metadata']['title']}: {d['links']['html']}")
@@ -114,10 +165,12 @@ class Zenodo:
         Returns:
             Dictionary mapping license IDs to license details
         """
-        hits = self.request(requests.get, f"{self.api_url}/licenses/")
-        # TODO: need to page through these; only the first few are returned
-        license_data = hits["hits"]["hits"]
-        return {item["id"]: item for item in license_data}
+        return {
+            item["id"]: item
+            for item in self._paginate(
+                f"{self.api_url}/licenses/", params={"size": PAGE_SIZE}
+            )
+        }
 
 
 class ZenodoFile:
@@ -141,7 +194,7 @@ class ZenodoFile:
     def delete(self) -> None:
         """Delete this file from the deposition."""
         self.client.request(
-            requests.delete,
+            "delete",
             f"{self.data['links']['self']}",
         )
         print(f"Deleted {self.filename} from {self.data['links']['bucket']}")
@@ -171,26 +224,51 @@ class ZenodoDeposition:
             f'ZenodoDeposition(id={self.id}, title="{self.data["metadata"]["title"]}")'
         )
 
-    def upload(self, content: bytes, name: str) -> Dict[str, Any]:
-        """Upload an artifact to this deposition."""
-        try:
-            bucket_url = self.links["bucket"]
-        except KeyError:
-            # Try old file API
-            uploaded = self.client.request(
-                requests.post,
-                f"{self.links['self']}/files",
-                data={"name": name},
-                files={"file": content},
-            )
-            print("Uploaded using old API")
-        else:
-            uploaded = self.client.request(
-                requests.put, f"{bucket_url}/{name}", data=content
-            )
-            print(f"Uploaded {uploaded['key']}: version {uploaded['version_id']}")
+    def upload(
+        self, content: Union[bytes, Path, BinaryIO], name: str
+    ) -> Dict[str, Any]:
+        """Upload an artifact to this deposition.
+
+        Paths and open binary files are streamed from disk rather than
+        loaded into memory.
+        """
+        with ExitStack() as stack:
+            if isinstance(content, Path):
+                content = stack.enter_context(open(content, "rb"))
+            try:
+                bucket_url = self.links["bucket"]
+            except KeyError:
+                # Try old file API
+                uploaded = self.client.request(
+                    "post",
+                    f"{self.links['self']}/files",
+                    data={"name": name},
+                    files={"file": (name, content)},
+                )
+                print("Uploaded using old API")
+            else:
+                uploaded = self.client.request(
+                    "put", f"{bucket_url}/{name}", data=content
+                )
+                print(f"Uploaded {uploaded['key']}: version {uploaded['version_id']}")
         return uploaded
 
+    def upload_many(
+        self,
+        files: Iterable[Tuple[Union[bytes, Path, BinaryIO], str]],
+        max_workers: int = UPLOAD_WORKERS,
+    ) -> List[Dict[str, Any]]:
+        """Upload several artifacts to this deposition concurrently.
+
+        Args:
+            files: Pairs of (content, name) as passed to ``upload``
+
+        Returns:
+            Upload results, in the same order as the files
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda f: self.upload(*f), files))
+
     def get_files(self) -> List[ZenodoFile]:
         """Get all files in this deposition.
 
@@ -199,7 +277,7 @@ class ZenodoDeposition:
         """
         files = self.data.get("files")
         if not files:
-            files = self.client.request(requests.get, self.links["files"])
+            files = self.client.request("get", self.links["files"])
         if not files:
             return []
         return [ZenodoFile(self.client, f) for f in files]
@@ -210,12 +288,12 @@ class ZenodoDeposition:
         Returns:
             New ZenodoDeposition object or none if not in draft
         """
-        latest_draft = self.client.request(requests.get, self.links["latest_draft"])
+        latest_draft = self.client.request("get", self.links["latest_draft"])
         return ZenodoDeposition(self.client, latest_draft)
 
     def get_latest_version(self) -> "ZenodoDeposition":
         """Get the latest version of this deposition."""
-        vers = self.client.request(requests.get, self.links["latest"])
+        vers = self.client.request("get", self.links["latest"])
         return ZenodoDeposition(self.client, vers)
 
     def create_new_version(self) -> "ZenodoDeposition":
@@ -227,7 +305,7 @@ class ZenodoDeposition:
         if self.data["state"] == "draft":
             return None
         # NOTE: even though the
-        result = self.client.request(requests.post, self.links["newversion"], json={})
+        result = self.client.request("post", self.links["newversion"], json={})
         print(f"Created new version {result['id']}: {result['links']['html']}")
         return ZenodoDeposition(self.client, result)
 
@@ -248,7 +326,7 @@ class ZenodoDeposition:
         if metadata is None:
             metadata = self.md
         self.data = self.client.request(
-            requests.put,
+            "put",
             self.links["self"],
             json={"metadata": metadata},
         )